@@ -1,97 +1,159 @@
 import asyncio
-from typing import Union, Tuple
+from time import monotonic
+from typing import List, Optional, Union
 
-from web3 import AsyncWeb3
+from aiohttp import ClientSession, TCPConnector
+from web3 import AsyncWeb3, AsyncHTTPProvider
 
 from .multicall.async_multicall import AsyncCall, AsyncMulticall
-from .utils import split, bar
+from .utils import split_indices, merge_indices, dedupe_params, bar, BAR_REFRESH_INTERVAL
+
+
+async def _cache_keepalive_session(w3: AsyncWeb3, limit: int = 64):
+    # web3's default session closes the connection after every request;
+    # a keep-alive connector saves a TCP/TLS handshake per bucket.
+    # A session already cached for this endpoint (e.g. by the user) is left untouched.
+    if not isinstance(w3.provider, AsyncHTTPProvider):
+        return
+    session = ClientSession(raise_for_status=True,
+                            connector=TCPConnector(limit=limit, keepalive_timeout=30, enable_cleanup_closed=True))
+    if await w3.provider.cache_async_session(session) is not session:
+        await session.close()
 
 
 class AsyncMulticallable:
     class Function:
         class FCall:
+            __slots__ = ('function', '_params', '_prepared')
+
             def __init__(self, function: 'AsyncMulticallable.Function', params: list):
                 self.function = function
                 self.params = params
 
-            async def call(self, n: int = 1, require_success: bool = True, progress_bar: bool = False,
-                           block_identifier: Union[str, int] = 'latest'):
-                mc = self.function.parent._multicall
-                calls = [AsyncCall(self.function.parent._target, self.function.name, args) for args in self.params]
-                result = []
-                prepared_calls = []
+            @property
+            def params(self) -> tuple:
+                return self._params
 
-                for i, bucket in enumerate(split(calls, n)):
-                    if not bucket:
-                        continue
-                    task = mc.call(bucket, require_success=require_success, block_identifier=block_identifier,
-                                   metadata=i)
-                    prepared_calls.append(task)
+            @params.setter
+            def params(self, params: list):
+                # copied, so that the prepared Calls always match; in-place changes to the caller's list don't apply
+                self._params = tuple(params)
+                self._prepared = {}
+
+            def refresh(self, params: list) -> 'AsyncMulticallable.Function.FCall':
+                """
+                Replaces params, dropping the Calls prepared for the previous ones.
+                """
+                self.params = params
+                return self
+
+            async def _prepare(self, dedupe: bool) -> tuple:
+                # Calls are built on first use and reused by later calls of this FCall, e.g. when polling
+                prepared = self._prepared.get(dedupe)
+                if prepared is None:
+                    params, index = dedupe_params(self.params) if dedupe else (self.params, None)
+                    calls = await self._make_calls(params)
+                    prepared = self._prepared[dedupe] = (calls, [call.payload for call in calls], index)
+                return prepared
+
+            async def _make_calls(self, params: list) -> List[AsyncCall]:
+                # abi encoding is pure-python CPU work; keep it off the event loop
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(None, AsyncCall.make_batch, self.function.parent._target,
+                                                  self.function.name, params, self.function.abi)
+
+            @staticmethod
+            async def _limited(semaphore: asyncio.Semaphore, coro):
+                async with semaphore:
+                    return await coro
+
+            async def _call_buckets(self, calls: List[AsyncCall], payloads: list, n: int, require_success: bool,
+                                    progress_bar: bool, block_identifier: Union[str, int], max_concurrency: int,
+                                    max_calls_per_rpc: Optional[int], max_bytes_per_rpc: Optional[int],
+                                    batch_rpc: bool) -> List[tuple]:
+                """
+                Runs one multicall per bucket of calls and returns (start, block number, outputs) per bucket,
+                in bucket order.
+                """
+                mc = self.function.parent._multicall
+                buckets = merge_indices(split_indices(len(calls), n), payloads, max_calls_per_rpc, max_bytes_per_rpc)
 
                 if progress_bar:
                     print(f'\r    {bar(0)} {0}/{n} buckets    ', end='')
 
-                i = 0
-                batch_results = [None] * len(prepared_calls)
-                for task in asyncio.as_completed(prepared_calls):
-                    task_result = await task
+                if batch_rpc:
+                    batch_results = await mc.batch_call([calls[start:stop] for start, stop, _ in buckets],
+                                                        require_success=require_success,
+                                                        block_identifier=block_identifier,
+                                                        payloads=[payloads[start:stop] for start, stop, _ in buckets],
+                                                        need_block_hash=False, max_concurrency=max_concurrency)
+                    results = [(start, block_number, outputs) for (start, _, _), (block_number, _, outputs)
+                               in zip(buckets, batch_results)]
+                else:
+                    semaphore = asyncio.Semaphore(max_concurrency)
+                    prepared_calls = [
+                        self._limited(semaphore, mc.call(calls[start:stop], require_success=require_success,
+                                                         block_identifier=block_identifier, metadata=i,
+                                                         payloads=payloads[start:stop], need_block_hash=False))
+                        for i, (start, stop, _) in enumerate(buckets)
+                    ]
+                    results = [None] * len(buckets)
                     if progress_bar:
-                        percentage = i / n * 100
-                        print(f'\r    {bar(percentage)} {i}/{n} buckets    ', end='')
-                        i += 1
-                    block_number, block_hash, outputs, metadata = task_result
-                    batch_results[metadata] = outputs
-
-                for br in batch_results:
-                    result.extend(br)
+                        done = 0
+                        last_render = 0.0
+                        for task in asyncio.as_completed(prepared_calls):
+                            block_number, _, outputs, i = await task
+                            results[i] = (buckets[i][0], block_number, outputs)
+                            done += buckets[i][2]
+                            now = monotonic()
+                            if now - last_render >= BAR_REFRESH_INTERVAL:
+                                print(f'\r    {bar(done / n * 100)} {done}/{n} buckets    ', end='')
+                                last_render = now
+                    else:
+                        for block_number, _, outputs, i in await asyncio.gather(*prepared_calls):
+                            results[i] = (buckets[i][0], block_number, outputs)
 
                 if progress_bar:
                     print(f'\r    {bar(100)} {n}/{n} buckets    ')
+                return results
 
+            async def call(self, n: int = 1, require_success: bool = True, progress_bar: bool = False,
+                           block_identifier: Union[str, int] = 'latest', max_concurrency: int = 32,
+                           max_calls_per_rpc: Optional[int] = None, max_bytes_per_rpc: Optional[int] = None,
+                           batch_rpc: bool = False):
+                # repeated params are called once and their outputs shared
+                calls, payloads, index = await self._prepare(dedupe=True)
+                result = [None] * len(calls)
+                for start, block_number, outputs in await self._call_buckets(calls, payloads, n, require_success,
+                                                                             progress_bar, block_identifier,
+                                                                             max_concurrency, max_calls_per_rpc,
+                                                                             max_bytes_per_rpc, batch_rpc):
+                    result[start:start + len(outputs)] = outputs
+                if index is not None:
+                    result = [result[i] for i in index]
                 return result
 
             async def detailed_call(self, n: int = 1, require_success: bool = True, progress_bar: bool = False,
-                                    block_identifier: Union[str, int] = 'latest'):
-                mc = self.function.parent._multicall
-                calls = [AsyncCall(self.function.parent._target, self.function.name, args) for args in self.params]
+                                    block_identifier: Union[str, int] = 'latest', max_concurrency: int = 32,
+                                    max_calls_per_rpc: Optional[int] = None, max_bytes_per_rpc: Optional[int] = None,
+                                    batch_rpc: bool = False):
+                calls, payloads, _ = await self._prepare(dedupe=False)
                 result = []
-
-                prepared_calls = []
-                for i, bucket in enumerate(split(calls, n)):
-                    if not bucket:
-                        continue
-                    prepared_calls.append(
-                        mc.call(bucket, require_success=require_success, block_identifier=block_identifier, metadata=i))
-
-                if progress_bar:
-                    print(f'\r    {bar(0)} {0}/{n} buckets    ', end='')
-
-                i = 0
-                batch_results = [None] * n
-                for task in asyncio.as_completed(prepared_calls):
-                    task_result = await task
-                    if progress_bar:
-                        percentage = i / n * 100
-                        print(f'\r    {bar(percentage)} {i}/{n} buckets    ', end='')
-                        i += 1
-                    block_number, block_hash, outputs, metadata = task_result
-                    batch_results[metadata] = (outputs, block_number)
-
-                for br in batch_results:
-                    br: Tuple
-                    block = br[1]
-                    if not result or result[-1]['block_number'] != block:
-                        result.append(dict(block_number=block, result=[]))
-                    result[-1]['result'].extend(br[0])
-
-                if progress_bar:
-                    print(f'\r    {bar(100)} {n}/{n} buckets    ')
-
+                for start, block_number, outputs in await self._call_buckets(calls, payloads, n, require_success,
+                                                                             progress_bar, block_identifier,
+                                                                             max_concurrency, max_calls_per_rpc,
+                                                                             max_bytes_per_rpc, batch_rpc):
+                    if not result or result[-1]['block_number'] != block_number:
+                        result.append(dict(block_number=block_number, result=[]))
+                    result[-1]['result'].extend(outputs)
                 return result
 
-        def __init__(self, name: str, parent: 'AsyncMulticallable'):
+        __slots__ = ('name', 'parent', 'abi')
+
+        def __init__(self, name: str, parent: 'AsyncMulticallable', abi: Optional[dict] = None):
             self.name = name
             self.parent = parent
+            self.abi = abi
 
         def __call__(self, params: list) -> FCall:
             return self.FCall(self, params)
@@ -99,7 +161,7 @@ class AsyncMulticallable:
     def __init__(self):
         self._multicall = None
         self._target = None
-        self._functions = None
+        self._function_abis = None
 
     async def setup(self, target_address: str, target_abi: str, w3: AsyncWeb3 = None, multicall: AsyncMulticall = None):
         if not w3 and not multicall:
@@ -107,20 +169,27 @@ class AsyncMulticallable:
         if multicall:
             self._multicall = multicall
         else:
+            # before the multicall setup, whose chain id request would otherwise cache web3's default session
+            await _cache_keepalive_session(w3)
             self._multicall = AsyncMulticall()
             await self._multicall.setup(w3)
         w3 = self._multicall.contract.w3
         self._target = w3.eth.contract(w3.to_checksum_address(target_address), abi=target_abi)
-        self._functions = {}
         self._setup_functions()
 
     def __getattr__(self, function_name: str) -> 'AsyncMulticallable.Function':
-        if function_name not in self._functions:
+        if function_name not in self._function_abis:
             raise AttributeError(f"The function '{function_name}' was not found in this contract's abi.")
-        return self._functions[function_name]
+        function = AsyncMulticallable.Function(function_name, self, self._function_abis[function_name])
+        setattr(self, function_name, function)
+        return function
+
+    def __dir__(self):
+        return [*super().__dir__(), *(self._function_abis or ())]
 
     def _setup_functions(self):
-        for func in filter(lambda x: x.get('stateMutability') in ('view', 'pure'), self._target.abi):
-            function = AsyncMulticallable.Function(func['name'], self)
-            self._functions[func['name']] = function
-            setattr(self, func['name'], function)
+        self._function_abis = {}
+        for func in self._target.abi:
+            if func.get('stateMutability') in ('view', 'pure'):
+                # overloaded functions are left to web3 to resolve per call
+                self._function_abis[func['name']] = None if func['name'] in self._function_abis else func
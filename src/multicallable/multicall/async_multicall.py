@@ -9,17 +9,18 @@ DESCRIPTION
 
 """
 
-from typing import List, Union, Optional, Any
+import asyncio
+from typing import Iterable, List, Union, Optional, Any
 
-from eth_abi import decode
 from web3 import AsyncWeb3
 from web3.contract import AsyncContract
-from web3.exceptions import BadFunctionCallOutput
+from web3.exceptions import Web3TypeError
 from web3.types import BlockIdentifier, StateOverride, TxParams
+from web3._utils.contracts import async_parse_block_identifier
 
-from .constants import MULTICALL_ABI, MULTICALL_ADDRESS, CHAIN_NANE, DEFAULT_MAKER_DAO_MULTICALL_ADDRESS, \
-    MULTICALL_BYTECODE
-from ..utils import get_type
+from .base import BaseMulticall, _CHAIN_ID_CACHE
+from .constants import MULTICALL_ABI, MULTICALL_ADDRESS, CHAIN_NANE, DEFAULT_MAKER_DAO_MULTICALL_ADDRESS
+from ..utils import resolve_function, get_abi_output_types, encode_call, encode_batch
 
 
 class AsyncCall:
@@ -38,25 +39,69 @@ class AsyncCall:
         args: list
             A list of arguments to be passed to a called contract function.
 
+        fn_abi: dict
+            The abi entry of the called function, if already resolved.
+            If omitted, it is looked up by fn_name in the contract abi.
+
     """
 
+    __slots__ = ('target', 'abi', 'fn_name', 'call_data', 'payload', 'out_types', 'decode_output')
+
     def __init__(
             self,
             contract: AsyncContract,
             fn_name: str,
             args: Union[list, tuple] = None,
             kwargs: dict = None,
+            fn_abi: Optional[dict] = None,
     ):
         if not isinstance(args, list) and not isinstance(args, tuple):
             args = [args]
-        call_data = contract.encode_abi(abi_element_identifier=fn_name, args=args, kwargs=kwargs)
+        fn_abi_key, (out_types, decode_output) = resolve_function(contract, fn_name)
+        call_data = encode_call(contract, fn_name, args, kwargs, fn_abi_key)
         self.target = contract.address
         self.abi = contract.abi
         self.fn_name = fn_name
         self.call_data = call_data
+        self.payload = (self.target, call_data)
+        if fn_abi is None:
+            self.out_types, self.decode_output = out_types, decode_output
+        else:
+            self.out_types, self.decode_output = get_abi_output_types(fn_abi)
 
-
-class AsyncMulticall:
+    @classmethod
+    def make_batch(cls, contract: AsyncContract, fn_name: str, params: Iterable,
+                   fn_abi: Optional[dict] = None) -> List['AsyncCall']:
+        """
+        Builds one AsyncCall per item of params, resolving the contract and function details only once.
+        fn_abi is the function's abi entry, if already resolved.
+        """
+        target = contract.address
+        abi = contract.abi
+        if fn_abi is None:
+            fn_abi_key, (out_types, decode_output) = resolve_function(contract, fn_name)
+        else:
+            out_types, decode_output = get_abi_output_types(fn_abi)
+        params = [args if isinstance(args, (list, tuple)) else [args] for args in params]
+        if fn_abi is None:
+            call_datas = [encode_call(contract, fn_name, args, fn_abi_key=fn_abi_key) for args in params]
+        else:
+            call_datas = encode_batch(contract, fn_name, params, fn_abi)
+        calls = []
+        for call_data in call_datas:
+            call = cls.__new__(cls)
+            call.target = target
+            call.abi = abi
+            call.fn_name = fn_name
+            call.call_data = call_data
+            call.payload = (target, call_data)
+            call.out_types = out_types
+            call.decode_output = decode_output
+            calls.append(call)
+        return calls
+
+
+class AsyncMulticall(BaseMulticall):
     """
     NAME
         AsyncMulticall
@@ -79,17 +124,18 @@ class AsyncMulticall:
             A custom name for provider chain.
             Use for loading MakerDao Multicall smart contract address from default dictionary.
 
-    """
+        chain_id: int
+            The chain ID of the provider, if already known.
+            If omitted, it is fetched from the provider once per w3 instance.
 
-    def __init__(self):
-        self.contract = None
-        self._impersonated = False
+    """
 
     async def setup(self, w3: AsyncWeb3,
                     custom_address: str = None,
                     custom_abi: str = None,
                     custom_chain_name: str = None,
-                    impersonated_address: str = None):
+                    impersonated_address: str = None,
+                    chain_id: int = None):
         if custom_address:
             address = AsyncWeb3.to_checksum_address(custom_address)
         elif impersonated_address:
@@ -104,7 +150,11 @@ class AsyncMulticall:
                     pass
                     # raise ValueError(f'Chain name `{custom_chain_name}` is not in default dictionary')
             else:
-                chain_id = await w3.eth.chain_id
+                if chain_id is None:
+                    chain_id = _CHAIN_ID_CACHE.get(w3)
+                if chain_id is None:
+                    chain_id = await w3.eth.chain_id
+                    _CHAIN_ID_CACHE[w3] = chain_id
                 try:
                     address = AsyncWeb3.to_checksum_address(MULTICALL_ADDRESS[CHAIN_NANE[chain_id]])
                 except KeyError:
@@ -113,7 +163,7 @@ class AsyncMulticall:
 
         abi = custom_abi or MULTICALL_ABI
 
-        self.contract = w3.eth.contract(address=address, abi=abi)
+        self._set_contract(w3, address, abi)
 
     async def call(
             self,
@@ -123,7 +173,9 @@ class AsyncMulticall:
             transaction: Optional[TxParams] = None,
             state_override: Optional[StateOverride] = None,
             ccip_read_enabled: Optional[bool] = None,
-            metadata: Any = None
+            metadata: Any = None,
+            payloads: Optional[List[tuple]] = None,
+            need_block_hash: bool = True
     ) -> tuple:
         """
         Executes multicall for specified list of smart contracts functions.
@@ -150,48 +202,88 @@ class AsyncMulticall:
             metadata: Any
                 any metadata that user wants to be passed in outputs
 
+            payloads: list(tuple)
+                precomputed (target, call_data) tuples of the calls, built from calls if omitted
+
+            need_block_hash: bool
+                if false and require_success is true, the lighter "aggregate" function is used
+                when the multicall contract has it, and the returned block hash is None
+
         Returns:
             list of outputs
         """
-        if self._impersonated:
-            if state_override is None:
-                state_override = {self.contract.address: dict(code=MULTICALL_BYTECODE)}
-            elif self.contract.address in state_override:
-                state_override[self.contract.address]['code'] = MULTICALL_BYTECODE
-            else:
-                state_override[self.contract.address] = dict(code=MULTICALL_BYTECODE)
-
-        block_number, block_hash, return_data = await self.contract.functions.tryBlockAndAggregate(
-            require_success, [(call.target, call.call_data) for call in calls]).call(
-            transaction=transaction,
-            block_identifier=block_identifier,
-            state_override=state_override,
+        call_data, decode = self._encode(payloads or [call.payload for call in calls], require_success,
+                                         need_block_hash)
+        return_data = await self.contract.w3.eth.call(
+            self._transaction(transaction, call_data),
+            block_identifier=await self._block_identifier(block_identifier),
+            state_override=self._state_override(state_override),
             ccip_read_enabled=ccip_read_enabled
         )
+        block_number, block_hash, outputs = self._unpack_response(calls, decode, return_data, require_success)
+        return block_number, block_hash, outputs, metadata
 
-        outputs = []
-        for call, (success, data) in zip(calls, return_data):
-            if not success:
-                try:
-                    error_message = ''.join(chr(c) for c in data if chr(c).isprintable())
-                except:
-                    error_message = 'Error'
-                outputs.append(ValueError(error_message))
-                continue
-            for item in call.abi:
-                if item.get('name') == call.fn_name:
-                    out_types = tuple(get_type(schema) for schema in item['outputs'])
-                    if out_types and not data:
-                        if require_success:
-                            raise BadFunctionCallOutput("Could not call contract function for a Call. "
-                                                        "Check Call's contract address correctness.")
-                        else:
-                            outputs.append(BadFunctionCallOutput())
-                            break
-                    decoded_output = decode(out_types, data)
-                    if len(item['outputs']) == 1:
-                        decoded_output = decoded_output[0]
-                    outputs.append(decoded_output)
-                    break
+    async def batch_call(
+            self,
+            buckets: List[List[AsyncCall]],
+            require_success: bool = True,
+            block_identifier: BlockIdentifier = None,
+            transaction: Optional[TxParams] = None,
+            state_override: Optional[StateOverride] = None,
+            ccip_read_enabled: Optional[bool] = None,
+            payloads: Optional[List[List[tuple]]] = None,
+            need_block_hash: bool = True,
+            max_concurrency: Optional[int] = None
+    ) -> List[tuple]:
+        """
+        Executes one multicall per bucket, all sent in a single JSON-RPC batch request.
+        Providers web3 cannot batch through (not JSON-RPC based) get concurrent separate requests instead;
+        an endpoint that rejects batch requests makes the call fail.
 
-        return block_number, block_hash, outputs, metadata
+        Parameters:
+            buckets: list(list)
+                list of lists of Call objets, one multicall per list
+
+            payloads: list(list)
+                precomputed (target, call_data) tuples of each bucket, built from buckets if omitted
+
+            max_concurrency: int
+                maximum number of separate requests in flight when the provider cannot batch, unbounded if omitted
+
+            other parameters are the same as in `call`
+
+        Returns:
+            list of (block number, block hash, list of outputs), one per bucket
+        """
+        if not buckets:
+            return []
+        payloads = payloads or [[call.payload for call in calls] for calls in buckets]
+        state_override = self._state_override(state_override)
+        block_identifier = await self._block_identifier(block_identifier)
+        try:
+            batch = self.contract.w3.batch_requests()
+        except Web3TypeError:
+            semaphore = asyncio.Semaphore(max_concurrency or len(buckets))
+
+            async def limited_call(calls, bucket_payloads):
+                async with semaphore:
+                    return await self.call(calls, require_success, block_identifier, transaction, state_override,
+                                           ccip_read_enabled, payloads=bucket_payloads,
+                                           need_block_hash=need_block_hash)
+
+            results = await asyncio.gather(*(
+                limited_call(calls, bucket_payloads) for calls, bucket_payloads in zip(buckets, payloads)
+            ))
+            return [result[:3] for result in results]
+
+        async with batch:
+            decoders = self._add_to_batch(batch, payloads, require_success, block_identifier, transaction,
+                                          state_override, ccip_read_enabled, need_block_hash)
+            responses = await batch.async_execute()
+
+        return [self._unpack_response(calls, decode, return_data, require_success)
+                for calls, decode, return_data in zip(buckets, decoders, responses)]
+
+    async def _block_identifier(self, block_identifier: BlockIdentifier) -> BlockIdentifier:
+        # same resolution as ContractFunction.call: negative numbers, block hashes, range checks
+        return await async_parse_block_identifier(self.contract.w3, block_identifier)
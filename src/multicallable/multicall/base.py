@@ -0,0 +1,131 @@
+"""NAME
+    BaseMulticall
+
+DESCRIPTION
+    The encoding and decoding shared by Multicall and AsyncMulticall.
+    Everything here is independent of whether the provider is sync or async.
+
+"""
+
+import weakref
+from typing import List, Optional
+
+from eth_abi.exceptions import DecodingError
+from web3.exceptions import BadFunctionCallOutput, Web3ValueError
+from web3.types import StateOverride, TxParams
+
+from .constants import MULTICALL_BYTECODE
+from ..utils import find_aggregate, get_function_codec, decode_error_message
+
+
+# chain id per w3 instance, so building many multicalls on one provider costs a single RPC
+_CHAIN_ID_CACHE = weakref.WeakKeyDictionary()
+
+
+class BaseMulticall:
+    """
+    NAME
+        BaseMulticall
+
+    DESCRIPTION
+       The base of Multicall and AsyncMulticall.
+
+    ATTRIBUTES
+        contract: Web3.eth.Contract
+            The multicall smart contract, set by `_set_contract`.
+
+    """
+
+    def __init__(self):
+        self.contract = None
+        self._try_block_and_aggregate = None
+        self._aggregate = None
+        self._impersonated = False
+        self._impersonation_override = None
+
+    def _set_contract(self, w3, address: str, abi):
+        self.contract = w3.eth.contract(address=address, abi=abi)
+        # built once, web3 only reads the override while formatting the request
+        self._impersonation_override = {address: dict(code=MULTICALL_BYTECODE)} if self._impersonated else None
+        # (encode, decode) pairs, so multicalls skip web3's ContractFunction argument and output processing
+        self._try_block_and_aggregate = get_function_codec(self.contract, 'tryBlockAndAggregate')
+        # aggregate leaves out the per-call success flags, for calls that all have to succeed anyway
+        aggregate_abi = find_aggregate(self.contract.abi)
+        self._aggregate = get_function_codec(self.contract, 'aggregate', aggregate_abi) if aggregate_abi else None
+
+    def _encode(self, payloads: List[tuple], require_success: bool, need_block_hash: bool) -> tuple:
+        """
+        Returns the call data of a multicall over payloads and the decoder of its return data.
+        """
+        if require_success and not need_block_hash and self._aggregate is not None:
+            encode, decode = self._aggregate
+            return encode((payloads,)), decode
+        encode, decode = self._try_block_and_aggregate
+        return encode((require_success, payloads)), decode
+
+    def _transaction(self, transaction: Optional[TxParams], call_data: bytes) -> TxParams:
+        transaction = dict(transaction) if transaction else {}
+        if 'data' in transaction:
+            raise Web3ValueError("Cannot set 'data' field in call transaction")
+        transaction.setdefault('to', self.contract.address)
+        if isinstance(self.contract.w3.eth.default_account, str):
+            transaction.setdefault('from', self.contract.w3.eth.default_account)
+        transaction['data'] = call_data
+        return transaction
+
+    def _state_override(self, state_override: Optional[StateOverride]) -> Optional[StateOverride]:
+        if self._impersonated:
+            if state_override is None:
+                state_override = self._impersonation_override
+            elif self.contract.address in state_override:
+                state_override[self.contract.address]['code'] = MULTICALL_BYTECODE
+            else:
+                state_override[self.contract.address] = dict(code=MULTICALL_BYTECODE)
+        return state_override
+
+    def _add_to_batch(self, batch, payloads: List[List[tuple]], require_success: bool, block_identifier,
+                      transaction: Optional[TxParams], state_override: Optional[StateOverride],
+                      ccip_read_enabled: Optional[bool], need_block_hash: bool) -> list:
+        """
+        Adds one multicall per item of payloads to a web3 batch and returns their decoders.
+        """
+        decoders = []
+        for bucket_payloads in payloads:
+            call_data, decode = self._encode(bucket_payloads, require_success, need_block_hash)
+            batch.add(self.contract.w3.eth.call(
+                self._transaction(transaction, call_data),
+                block_identifier=block_identifier,
+                state_override=state_override,
+                ccip_read_enabled=ccip_read_enabled
+            ))
+            decoders.append(decode)
+        return decoders
+
+    @classmethod
+    def _unpack_response(cls, calls: list, decode, return_data: bytes, require_success: bool) -> tuple:
+        try:
+            response = decode(return_data)
+        except DecodingError as e:
+            raise BadFunctionCallOutput("Could not decode the multicall's return data. "
+                                        "Check the multicall contract address correctness.") from e
+        if len(response) == 2:  # aggregate: (block number, return data), every call succeeded
+            block_number, return_data = response
+            return block_number, None, cls._decode_outputs(calls, [(True, data) for data in return_data], True)
+        block_number, block_hash, return_data = response
+        return block_number, block_hash, cls._decode_outputs(calls, return_data, require_success)
+
+    @staticmethod
+    def _decode_outputs(calls: list, return_data: list, require_success: bool) -> list:
+        outputs = [None] * min(len(calls), len(return_data))
+        bad_output = BadFunctionCallOutput
+        for i, (call, (success, data)) in enumerate(zip(calls, return_data)):
+            if not success:
+                outputs[i] = ValueError(decode_error_message(data))
+            elif call.out_types and not data:
+                if require_success:
+                    raise bad_output("Could not call contract function for a Call. "
+                                     "Check Call's contract address correctness.")
+                outputs[i] = bad_output()
+            else:
+                outputs[i] = call.decode_output(data)
+        return outputs
@@ -9,17 +9,17 @@ DESCRIPTION
 
 """
 
-from typing import List, Union, Tuple, Any, Optional
+from typing import Iterable, List, Union, Tuple, Any, Optional
 
-from eth_abi import decode
 from web3 import Web3
 from web3.contract import Contract
-from web3.exceptions import BadFunctionCallOutput
+from web3.exceptions import Web3TypeError
 from web3.types import BlockIdentifier, StateOverride, TxParams
+from web3._utils.contracts import parse_block_identifier
 
-from .constants import MULTICALL_ABI, MULTICALL_ADDRESS, CHAIN_NANE, DEFAULT_MAKER_DAO_MULTICALL_ADDRESS, \
-    MULTICALL_BYTECODE
-from ..utils import get_type
+from .base import BaseMulticall, _CHAIN_ID_CACHE
+from .constants import MULTICALL_ABI, MULTICALL_ADDRESS, CHAIN_NANE, DEFAULT_MAKER_DAO_MULTICALL_ADDRESS
+from ..utils import resolve_function, get_abi_output_types, encode_call, encode_batch
 
 
 class Call:
@@ -41,25 +41,69 @@ class Call:
         kwargs: dict
             keyword arguments to be passed to a called contract function.
 
+        fn_abi: dict
+            The abi entry of the called function, if already resolved.
+            If omitted, it is looked up by fn_name in the contract abi.
+
     """
 
+    __slots__ = ('target', 'abi', 'fn_name', 'call_data', 'payload', 'out_types', 'decode_output')
+
     def __init__(
             self,
             contract: Contract,
             fn_name: str,
             args: Optional[Union[list, tuple]] = None,
             kwargs: Optional[dict] = None,
+            fn_abi: Optional[dict] = None,
     ):
         if args is not None and not isinstance(args, list) and not isinstance(args, tuple):
             args = [args]
-        call_data = contract.encode_abi(abi_element_identifier=fn_name, args=args, kwargs=kwargs)
+        fn_abi_key, (out_types, decode_output) = resolve_function(contract, fn_name)
+        call_data = encode_call(contract, fn_name, args, kwargs, fn_abi_key)
         self.target = contract.address
         self.abi = contract.abi
         self.fn_name = fn_name
         self.call_data = call_data
+        self.payload = (self.target, call_data)
+        if fn_abi is None:
+            self.out_types, self.decode_output = out_types, decode_output
+        else:
+            self.out_types, self.decode_output = get_abi_output_types(fn_abi)
 
-
-class Multicall:
+    @classmethod
+    def make_batch(cls, contract: Contract, fn_name: str, params: Iterable,
+                   fn_abi: Optional[dict] = None) -> List['Call']:
+        """
+        Builds one Call per item of params, resolving the contract and function details only once.
+        fn_abi is the function's abi entry, if already resolved.
+        """
+        target = contract.address
+        abi = contract.abi
+        if fn_abi is None:
+            fn_abi_key, (out_types, decode_output) = resolve_function(contract, fn_name)
+        else:
+            out_types, decode_output = get_abi_output_types(fn_abi)
+        params = [args if args is None or isinstance(args, (list, tuple)) else [args] for args in params]
+        if fn_abi is None:
+            call_datas = [encode_call(contract, fn_name, args, fn_abi_key=fn_abi_key) for args in params]
+        else:
+            call_datas = encode_batch(contract, fn_name, params, fn_abi)
+        calls = []
+        for call_data in call_datas:
+            call = cls.__new__(cls)
+            call.target = target
+            call.abi = abi
+            call.fn_name = fn_name
+            call.call_data = call_data
+            call.payload = (target, call_data)
+            call.out_types = out_types
+            call.decode_output = decode_output
+            calls.append(call)
+        return calls
+
+
+class Multicall(BaseMulticall):
     """
     NAME
         Multicall
@@ -82,6 +126,10 @@ class Multicall:
             A custom name for provider chain.
             Use for loading MakerDao Multicall smart contract address from default dictionary.
 
+        chain_id: int
+            The chain ID of the provider, if already known.
+            If omitted, it is fetched from the provider once per w3 instance.
+
     """
 
     def __init__(
@@ -90,9 +138,10 @@ class Multicall:
             custom_address: str = None,
             custom_abi: str = None,
             custom_chain_name: str = None,
-            impersonated_address: str = None
+            impersonated_address: str = None,
+            chain_id: int = None
     ):
-        self._impersonated = False
+        super().__init__()
         if custom_address:
             address = Web3.to_checksum_address(custom_address)
         elif impersonated_address:
@@ -107,7 +156,11 @@ class Multicall:
                     pass
                     # raise ValueError(f'Chain name `{custom_chain_name}` is not in default dictionary')
             else:
-                chain_id = w3.eth.chain_id
+                if chain_id is None:
+                    chain_id = _CHAIN_ID_CACHE.get(w3)
+                if chain_id is None:
+                    chain_id = w3.eth.chain_id
+                    _CHAIN_ID_CACHE[w3] = chain_id
                 try:
                     address = Web3.to_checksum_address(MULTICALL_ADDRESS[CHAIN_NANE[chain_id]])
                 except KeyError:
@@ -116,7 +169,7 @@ class Multicall:
 
         abi = custom_abi or MULTICALL_ABI
 
-        self.contract = w3.eth.contract(address=address, abi=abi)
+        self._set_contract(w3, address, abi)
 
     def call(
             self,
@@ -125,7 +178,9 @@ class Multicall:
             block_identifier: BlockIdentifier = None,
             transaction: Optional[TxParams] = None,
             state_override: Optional[StateOverride] = None,
-            ccip_read_enabled: Optional[bool] = None
+            ccip_read_enabled: Optional[bool] = None,
+            payloads: Optional[List[tuple]] = None,
+            need_block_hash: bool = True
     ) -> Tuple[int, bytes, List[Any]]:
         """
         Executes multicall for specified list of smart contracts functions.
@@ -149,50 +204,77 @@ class Multicall:
             ccip_read_enabled: bool
                 boolean flag that enables or disables CCIP Read support for web3 calls
 
+            payloads: list(tuple)
+                precomputed (target, call_data) tuples of the calls, built from calls if omitted
+
+            need_block_hash: bool
+                if false and require_success is true, the lighter "aggregate" function is used
+                when the multicall contract has it, and the returned block hash is None
+
         Returns:
             block number of fetched data
             block hash of fetched data
             list of outputs (fetched data)
         """
-        if self._impersonated:
-            if state_override is None:
-                state_override = {self.contract.address: dict(code=MULTICALL_BYTECODE)}
-            elif self.contract.address in state_override:
-                state_override[self.contract.address]['code'] = MULTICALL_BYTECODE
-            else:
-                state_override[self.contract.address] = dict(code=MULTICALL_BYTECODE)
-
-        block_number, block_hash, return_data = self.contract.functions.tryBlockAndAggregate(
-            require_success, [(call.target, call.call_data) for call in calls]).call(
-            transaction=transaction,
-            block_identifier=block_identifier,
-            state_override=state_override,
+        call_data, decode = self._encode(payloads or [call.payload for call in calls], require_success,
+                                         need_block_hash)
+        return_data = self.contract.w3.eth.call(
+            self._transaction(transaction, call_data),
+            block_identifier=self._block_identifier(block_identifier),
+            state_override=self._state_override(state_override),
             ccip_read_enabled=ccip_read_enabled
         )
+        block_number, block_hash, outputs = self._unpack_response(calls, decode, return_data, require_success)
+        return block_number, block_hash, outputs
 
-        outputs = []
-        for call, (success, data) in zip(calls, return_data):
-            if not success:
-                try:
-                    error_message = ''.join(chr(c) for c in data if chr(c).isprintable())
-                except:
-                    error_message = 'Error'
-                outputs.append(ValueError(error_message))
-                continue
-            for item in call.abi:
-                if item.get('name') == call.fn_name:
-                    out_types = tuple(get_type(schema) for schema in item['outputs'])
-                    if out_types and not data:
-                        if require_success:
-                            raise BadFunctionCallOutput("Could not call contract function for a Call. "
-                                                        "Check Call's contract address correctness.")
-                        else:
-                            outputs.append(BadFunctionCallOutput())
-                            break
-                    decoded_output = decode(out_types, data)
-                    if len(item['outputs']) == 1:
-                        decoded_output = decoded_output[0]
-                    outputs.append(decoded_output)
-                    break
+    def batch_call(
+            self,
+            buckets: List[List[Call]],
+            require_success: bool = True,
+            block_identifier: BlockIdentifier = None,
+            transaction: Optional[TxParams] = None,
+            state_override: Optional[StateOverride] = None,
+            ccip_read_enabled: Optional[bool] = None,
+            payloads: Optional[List[List[tuple]]] = None,
+            need_block_hash: bool = True
+    ) -> List[Tuple[int, bytes, List[Any]]]:
+        """
+        Executes one multicall per bucket, all sent in a single JSON-RPC batch request.
+        Providers web3 cannot batch through (not JSON-RPC based) get separate requests instead;
+        an endpoint that rejects batch requests makes the call fail.
 
-        return block_number, block_hash, outputs
+        Parameters:
+            buckets: list(list)
+                list of lists of Call objets, one multicall per list
+
+            payloads: list(list)
+                precomputed (target, call_data) tuples of each bucket, built from buckets if omitted
+
+            other parameters are the same as in `call`
+
+        Returns:
+            list of (block number, block hash, list of outputs), one per bucket
+        """
+        if not buckets:
+            return []
+        payloads = payloads or [[call.payload for call in calls] for calls in buckets]
+        state_override = self._state_override(state_override)
+        block_identifier = self._block_identifier(block_identifier)
+        try:
+            batch = self.contract.w3.batch_requests()
+        except Web3TypeError:
+            return [self.call(calls, require_success, block_identifier, transaction, state_override,
+                              ccip_read_enabled, payloads=bucket_payloads, need_block_hash=need_block_hash)
+                    for calls, bucket_payloads in zip(buckets, payloads)]
+
+        with batch:
+            decoders = self._add_to_batch(batch, payloads, require_success, block_identifier, transaction,
+                                          state_override, ccip_read_enabled, need_block_hash)
+            responses = batch.execute()
+
+        return [self._unpack_response(calls, decode, return_data, require_success)
+                for calls, decode, return_data in zip(buckets, decoders, responses)]
+
+    def _block_identifier(self, block_identifier: BlockIdentifier) -> BlockIdentifier:
+        # same resolution as ContractFunction.call: negative numbers, block hashes, range checks
+        return parse_block_identifier(self.contract.w3, block_identifier)
@@ -1,54 +1,133 @@
-from typing import Union
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Optional, Union
 
 from web3 import Web3
 
 from .multicall import Multicall, Call
-from .utils import split, bar
+from .utils import split_indices, merge_indices, dedupe_params, bar
 
 
 class Multicallable:
     class Function:
         class FCall:
+            __slots__ = ('function', '_params', '_prepared')
+
             def __init__(self, function: 'Multicallable.Function', params: list):
                 self.function = function
                 self.params = params
 
-            def call(self, n: int = 1, require_success: bool = True, progress_bar: bool = False,
-                     block_identifier: Union[str, int] = 'latest'):
+            @property
+            def params(self) -> tuple:
+                return self._params
+
+            @params.setter
+            def params(self, params: list):
+                # copied, so that the prepared Calls always match; in-place changes to the caller's list don't apply
+                self._params = tuple(params)
+                self._prepared = {}
+
+            def refresh(self, params: list) -> 'Multicallable.Function.FCall':
+                """
+                Replaces params, dropping the Calls prepared for the previous ones.
+                """
+                self.params = params
+                return self
+
+            def _prepare(self, dedupe: bool) -> tuple:
+                # Calls are built on first use and reused by later calls of this FCall, e.g. when polling
+                prepared = self._prepared.get(dedupe)
+                if prepared is None:
+                    params, index = dedupe_params(self.params) if dedupe else (self.params, None)
+                    calls = Call.make_batch(self.function.parent._target, self.function.name, params,
+                                            self.function.abi)
+                    prepared = self._prepared[dedupe] = (calls, [call.payload for call in calls], index)
+                return prepared
+
+            def _call_buckets(self, calls: list, payloads: list, n: int, require_success: bool, progress_bar: bool,
+                              block_identifier: Union[str, int], max_workers: int,
+                              max_calls_per_rpc: Optional[int], max_bytes_per_rpc: Optional[int], batch_rpc: bool):
                 mc = self.function.parent._multicall
-                calls = [Call(self.function.parent._target, self.function.name, args) for args in self.params]
-                result = []
-                for i, bucket in enumerate(split(calls, n)):
-                    if progress_bar:
-                        percentage = i / n * 100
-                        print(f'\r    {bar(percentage)} {i}/{n} buckets    ', end='')
-                    if not bucket:
-                        continue
-                    block_number, block_hash, outputs = mc.call(bucket, require_success=require_success,
-                                                                block_identifier=block_identifier)
-                    result.extend(outputs)
+                buckets = merge_indices(split_indices(len(calls), n), payloads, max_calls_per_rpc, max_bytes_per_rpc)
+
+                def call_bucket(bucket):
+                    start, stop, _ = bucket
+                    return mc.call(calls[start:stop], require_success=require_success,
+                                   block_identifier=block_identifier, payloads=payloads[start:stop],
+                                   need_block_hash=False)
+
+                if progress_bar:
+                    print(f'\r    {bar(0)} {0}/{n} buckets    ', end='')
+
+                done = 0
+                last_percentage = 0
+
+                def advance(count):
+                    # redraw only when the integer percentage moves
+                    nonlocal done, last_percentage
+                    done += count
+                    percentage = done * 100 // n
+                    if progress_bar and percentage != last_percentage:
+                        print(f'\r    {bar(percentage)} {done}/{n} buckets    ', end='')
+                        last_percentage = percentage
+
+                if batch_rpc:
+                    results = mc.batch_call([calls[start:stop] for start, stop, _ in buckets],
+                                            require_success=require_success, block_identifier=block_identifier,
+                                            payloads=[payloads[start:stop] for start, stop, _ in buckets],
+                                            need_block_hash=False)
+                elif max_workers == 1:
+                    results = []
+                    for bucket in buckets:
+                        results.append(call_bucket(bucket))
+                        advance(bucket[2])
+                else:
+                    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                        futures = {executor.submit(call_bucket, bucket): bucket for bucket in buckets}
+                        for future in as_completed(futures):
+                            advance(futures[future][2])
+                    results = [future.result() for future in futures]
+
                 if progress_bar:
                     print(f'\r    {bar(100)} {n}/{n} buckets    ')
+                return results
+
+            def call(self, n: int = 1, require_success: bool = True, progress_bar: bool = False,
+                     block_identifier: Union[str, int] = 'latest', max_workers: int = 1,
+                     max_calls_per_rpc: Optional[int] = None, max_bytes_per_rpc: Optional[int] = None,
+                     batch_rpc: bool = False):
+                # repeated params are called once and their outputs shared
+                calls, payloads, index = self._prepare(dedupe=True)
+                result = []
+                for block_number, block_hash, outputs in self._call_buckets(calls, payloads, n, require_success,
+                                                                            progress_bar, block_identifier, max_workers,
+                                                                            max_calls_per_rpc, max_bytes_per_rpc,
+                                                                            batch_rpc):
+                    result.extend(outputs)
+                if index is not None:
+                    result = [result[i] for i in index]
                 return result
 
             def detailed_call(self, n: int = 1, require_success: bool = True,
-                              block_identifier: Union[str, int] = 'latest'):
-                mc = self.function.parent._multicall
-                calls = [Call(self.function.parent._target, self.function.name, args) for args in self.params]
+                              block_identifier: Union[str, int] = 'latest', max_workers: int = 1,
+                              max_calls_per_rpc: Optional[int] = None, max_bytes_per_rpc: Optional[int] = None,
+                              batch_rpc: bool = False):
+                calls, payloads, _ = self._prepare(dedupe=False)
                 result = []
-                for bucket in split(calls, n):
-                    if not bucket:
-                        continue
-                    block_number, block_hash, outputs = mc.call(bucket, require_success=require_success,
-                                                                block_identifier=block_identifier)
+                for block_number, block_hash, outputs in self._call_buckets(calls, payloads, n, require_success, False,
+                                                                            block_identifier, max_workers,
+                                                                            max_calls_per_rpc, max_bytes_per_rpc,
+                                                                            batch_rpc):
                     if not result or result[-1]['block_number'] != block_number:
                         result.append(dict(block_number=block_number, result=[]))
                     result[-1]['result'].extend(outputs)
                 return result
 
-        def __init__(self, name: str, parent: 'Multicallable'):
+        __slots__ = ('name', 'parent', 'abi')
+
+        def __init__(self, name: str, parent: 'Multicallable', abi: Optional[dict] = None):
             self.name = name
             self.parent = parent
+            self.abi = abi
 
         def __call__(self, params: list) -> FCall:
             return self.FCall(self, params)
@@ -59,16 +138,21 @@ class Multicallable:
         self._multicall = multicall or Multicall(w3)
         w3 = self._multicall.contract.w3
         self._target = w3.eth.contract(w3.to_checksum_address(target_address), abi=target_abi)
-        self._functions = {}
         self._setup_functions()
 
     def __getattr__(self, function_name: str) -> 'Multicallable.Function':
-        if function_name not in self._functions:
+        if function_name not in self._function_abis:
             raise AttributeError(f"The function '{function_name}' was not found in this contract's abi.")
-        return self._functions[function_name]
+        function = Multicallable.Function(function_name, self, self._function_abis[function_name])
+        setattr(self, function_name, function)
+        return function
+
+    def __dir__(self):
+        return [*super().__dir__(), *self._function_abis]
 
     def _setup_functions(self):
-        for func in filter(lambda x: x.get('stateMutability') in ('view', 'pure'), self._target.abi):
-            function = Multicallable.Function(func['name'], self)
-            self._functions[func['name']] = function
-            setattr(self, func['name'], function)
+        self._function_abis = {}
+        for func in self._target.abi:
+            if func.get('stateMutability') in ('view', 'pure'):
+                # overloaded functions are left to web3 to resolve per call
+                self._function_abis[func['name']] = None if func['name'] in self._function_abis else func
@@ -1,24 +1,124 @@
+import json
+import weakref
+from functools import lru_cache
+
+from eth_abi import decode as abi_decode
+from eth_abi.decoding import ContextFramesBytesIO, TupleDecoder
+from eth_abi.exceptions import DecodingError, EncodingError
+from eth_abi.registry import registry
+from eth_utils import is_checksum_address
+from eth_utils.abi import collapse_if_tuple, function_abi_to_4byte_selector, get_abi_input_types, \
+    get_aligned_abi_inputs
+from web3.exceptions import ABIFunctionNotFound
+
+# selector of solidity's Error(string), which revert("reason") returns
+ERROR_STRING_SELECTOR = b'\x08\xc3\x79\xa0'
+_NON_PRINTABLE = dict.fromkeys(i for i in range(256) if not chr(i).isprintable())
+
+# minimum seconds between two progress bar redraws (~30 Hz)
+BAR_REFRESH_INTERVAL = 1 / 30
+
+
+_BAR_CHAR = '━'
+_BAR_HEAD = '╸'
+_PINK = '\033[38;2;249;38;114m'
+_GREY = '\033[38;2;58;58;58m'
+_GREEN = '\033[38;2;114;156;31m'
+_RESET = '\033[39m'
+
+
+def _render_bar(percentage: int, size: int):
+    if percentage >= 100:
+        return f'{_GREEN}{_BAR_CHAR * size}{_RESET}'
+    filled = max(size * percentage // 100, 0)
+    return f'{_PINK}{_BAR_CHAR * filled}{_BAR_HEAD}{_GREY}{_BAR_CHAR * (size - filled - 1)}{_RESET}'
+
+
+_BAR_LUT = tuple(_render_bar(percentage, 40) for percentage in range(101))
+
+
 def bar(percentage: float, size: int = 40):
     percentage = int(percentage)
-    hori_char = '━'
-    left_char = '╸'
-    pink = (249, 38, 114)
-    grey = (58, 58, 58)
-    green = (114, 156, 31)
-    start_pink = '\033[38;2;%d;%d;%dm' % pink
-    start_grey = '\033[38;2;%d;%d;%dm' % grey
-    start_green = '\033[38;2;%d;%d;%dm' % green
-    reset_color = '\033[39m'
-    if percentage >= 100:
-        return f'{start_green}{hori_char * size}{reset_color}'
-    filled = hori_char * (size * percentage // 100)
-    not_filled = hori_char * (size - len(filled) - 1)
-    return f'{start_pink}{filled}{left_char}{start_grey}{not_filled}{reset_color}'
+    if size == 40 and percentage >= 0:
+        return _BAR_LUT[min(percentage, 100)]
+    return _render_bar(percentage, size)
+
+
+def split_indices(total, n):
+    k, m = divmod(total, n)
+    return ((i * k + min(i, m), (i + 1) * k + min(i + 1, m)) for i in range(n))
+
+
+def merge_indices(indices, payloads, max_calls=None, max_bytes=None):
+    """Greedily merges adjacent non-empty (start, stop) ranges into (start, stop, merged_count)
+    while the merged range stays within max_calls calls and max_bytes bytes of call data."""
+    merged = []
+    merged_bytes = 0
+    for start, stop in indices:
+        if start == stop:
+            continue
+        bucket_bytes = 0
+        if max_bytes is not None:
+            bucket_bytes = sum(len(call_data) for target, call_data in payloads[start:stop]) // 2  # hex string
+        if merged and (max_calls is not None or max_bytes is not None):
+            merged_start, merged_stop, count = merged[-1]
+            if (max_calls is None or stop - merged_start <= max_calls) and \
+                    (max_bytes is None or merged_bytes + bucket_bytes <= max_bytes):
+                merged[-1] = (merged_start, stop, count + 1)
+                merged_bytes += bucket_bytes
+                continue
+        merged.append((start, stop, 1))
+        merged_bytes = bucket_bytes
+    return merged
+
+
+def dedupe_params(params):
+    """Returns (distinct params, index of each param's distinct entry),
+    or (params, None) when nothing repeats or params can't be hashed."""
+    positions = {}
+    unique = []
+    index = []
+    try:
+        for args in params:
+            # nested types are part of the key so that e.g. (1, True) and (1, 1) aren't merged
+            key = value_key(args)
+            position = positions.get(key)
+            if position is None:
+                position = positions[key] = len(unique)
+                unique.append(args)
+            index.append(position)
+    except TypeError:
+        return params, None
+    if len(unique) == len(index):
+        return params, None
+    return unique, index
 
 
 def split(a, n):
-    k, m = divmod(len(a), n)
-    return (a[i * k + min(i, m):(i + 1) * k + min(i + 1, m)] for i in range(n))
+    return (a[start:stop] for start, stop in split_indices(len(a), n))
+
+
+def find_aggregate(abi):
+    """Returns the abi entry of MakerDao's aggregate((address,bytes)[]) returns (uint256, bytes[]), or None."""
+    return next((item for item in abi if item.get('type') == 'function' and item.get('name') == 'aggregate' and
+                 get_abi_input_types(item) == ['(address,bytes)[]'] and
+                 [schema['type'] for schema in item.get('outputs', ())] == ['uint256', 'bytes[]']), None)
+
+
+def get_function_codec(contract, fn_name, fn_abi=None):
+    """Returns (encode, decode) for a function of contract: encode(args) builds its call data and
+    decode(return_data) decodes its outputs, without web3's per-call ContractFunction machinery.
+    fn_abi is the function's abi entry, if already resolved."""
+    if fn_abi is None:
+        fn_abi = next((item for item in contract.abi if item.get('type') == 'function' and
+                       item.get('name') == fn_name), None)
+    if fn_abi is None:
+        raise ABIFunctionNotFound(f"Function '{fn_name}' is not in the ABI of contract {contract.address}")
+    selector = function_abi_to_4byte_selector(fn_abi)
+    in_types = get_abi_input_types(fn_abi)
+    encode = contract.w3.codec.encode
+    decoder = TupleDecoder(decoders=[registry.get_decoder(collapse_if_tuple(schema)) for schema in fn_abi['outputs']])
+    return lambda args: selector + encode(in_types, args), lambda data: decoder(ContextFramesBytesIO(data))
 
 
 def get_type(schema):
@@ -28,3 +128,167 @@ def get_type(schema):
     elif schema.get('internalType', '').startswith('enum'):
         return schema['type']
     return schema.get('internalType', schema['type'])
+
+
+def decode_error_message(data):
+    if data[:4] == ERROR_STRING_SELECTOR:
+        try:
+            return abi_decode(('string',), data[4:])[0]
+        except (DecodingError, UnicodeDecodeError):
+            pass
+    # anything else keeps its printable bytes, one character per byte
+    return data.decode('latin-1').translate(_NON_PRINTABLE)
+
+
+def _make_output_decoder(out_types):
+    decoder = TupleDecoder(decoders=[registry.get_decoder(type_str) for type_str in out_types])
+    if len(out_types) != 1:
+        return lambda data: decoder(ContextFramesBytesIO(data))
+
+    def decode_single(data):
+        return decoder(ContextFramesBytesIO(data))[0]
+
+    # one-word results are read straight from the bytes; anything short or
+    # non-canonical goes through eth_abi so it fails exactly as before
+    if out_types[0] == 'uint256':
+        return lambda data: int.from_bytes(data[:32], 'big') if len(data) >= 32 else decode_single(data)
+    if out_types[0] == 'int256':
+        return lambda data: int.from_bytes(data[:32], 'big', signed=True) if len(data) >= 32 else decode_single(data)
+    if out_types[0] == 'address':
+        return lambda data: '0x' + data[12:32].hex() if len(data) >= 32 and not any(data[:12]) else decode_single(data)
+    if out_types[0] == 'bytes32':
+        return lambda data: bytes(data[:32]) if len(data) >= 32 else decode_single(data)
+    if out_types[0] == 'bool':
+        return lambda data: data[31] == 1 if len(data) >= 32 and not any(data[:31]) and data[31] <= 1 \
+            else decode_single(data)
+    return decode_single
+
+
+def abi_key(value):
+    """A hashable key for abi json content, so caches don't depend on (and keep alive) the abi objects."""
+    return json.dumps(value, sort_keys=True)
+
+
+@lru_cache(maxsize=1024)
+def _compile_outputs(outputs_key):
+    out_types = tuple(get_type(schema) for schema in json.loads(outputs_key))
+    return out_types, _make_output_decoder(out_types)
+
+
+def get_abi_output_types(fn_abi):
+    return _compile_outputs(abi_key(fn_abi['outputs']))
+
+
+def get_output_types(abi, fn_name):
+    # only the name lookup runs per call; the compiled outputs are shared by content
+    return get_abi_output_types(next(item for item in abi if item.get('name') == fn_name))
+
+
+_ENCODE_CACHE = {}
+_ENCODE_CACHE_SIZE = 4096
+
+
+def value_key(value):
+    """A hashable key of an argument that also holds the type of every nested value,
+    so that e.g. (1, True) and (1, 1) don't share an entry. Raises TypeError if value can't be hashed."""
+    if isinstance(value, (list, tuple)):
+        return type(value), tuple(value_key(item) for item in value)
+    if isinstance(value, dict):
+        return dict, tuple(sorted((key, value_key(item)) for key, item in value.items()))
+    hash(value)
+    return type(value), value
+
+
+def function_abi_key(abi, fn_name):
+    return abi_key([item for item in abi if item.get('type') == 'function' and item.get('name') == fn_name])
+
+
+# (abi key, (output types, output decoder)) per function name of each contract instance, so that building
+# single Calls doesn't serialize the abi each time; weak, so the contract and its w3 can still be collected
+_CONTRACT_FUNCTIONS = weakref.WeakKeyDictionary()
+
+
+def resolve_function(contract, fn_name):
+    functions = _CONTRACT_FUNCTIONS.get(contract)
+    if functions is None:
+        functions = _CONTRACT_FUNCTIONS[contract] = {}
+    resolved = functions.get(fn_name)
+    if resolved is None:
+        resolved = functions[fn_name] = (function_abi_key(contract.abi, fn_name),
+                                         get_output_types(contract.abi, fn_name))
+    return resolved
+
+
+def encode_call(contract, fn_name, args=None, kwargs=None, fn_abi_key=None):
+    # keyed on the contract's address and abi content rather than the contract, which would keep its w3 alive
+    if fn_abi_key is None:
+        fn_abi_key = resolve_function(contract, fn_name)[0]
+    try:
+        key = (contract.address, fn_abi_key, value_key(tuple(args or ())), value_key(kwargs or {}))
+    except TypeError:  # unhashable or unorderable arguments
+        return contract.encode_abi(abi_element_identifier=fn_name, args=args, kwargs=kwargs)
+    call_data = _ENCODE_CACHE.get(key)
+    if call_data is None:
+        call_data = contract.encode_abi(abi_element_identifier=fn_name, args=args, kwargs=kwargs)
+        if len(_ENCODE_CACHE) >= _ENCODE_CACHE_SIZE:
+            _ENCODE_CACHE.clear()
+        _ENCODE_CACHE[key] = call_data
+    return call_data
+
+
+def _one_word_encoder(type_str):
+    # hand-padded encoders for the commonest single arguments; None means "use the codec"
+    if type_str == 'address':
+        return lambda value: b'\x00' * 12 + bytes.fromhex(value[2:]) if is_checksum_address(value) else None
+    if type_str == 'uint256':
+        return lambda value: value.to_bytes(32, 'big') if type(value) is int and 0 <= value < 2 ** 256 else None
+    if type_str == 'bytes32':
+        return lambda value: value if type(value) is bytes and len(value) == 32 else None
+    return lambda value: None
+
+
+@lru_cache(maxsize=1024)
+def _compile_inputs(fn_abi_key):
+    fn_abi = json.loads(fn_abi_key)
+    arg_types = get_abi_input_types(fn_abi)
+    return (
+        function_abi_to_4byte_selector(fn_abi),
+        arg_types,
+        # nested addresses need web3's checksum validation, so such functions always go through web3
+        any('address' in type_str and type_str != 'address' for type_str in arg_types),
+        _one_word_encoder(arg_types[0]) if len(arg_types) == 1 else None,
+        [i for i, type_str in enumerate(arg_types) if type_str == 'address'],
+        # struct arguments may be dicts, which have to be aligned to the abi components
+        any(type_str.startswith('(') for type_str in arg_types),
+    )
+
+
+def encode_batch(contract, fn_name, params, fn_abi):
+    """Encodes the call data for each args of params, with the function's selector and input types
+    resolved once per abi entry. Arguments the codec can't take as they are (ENS names,
+    non-checksum addresses, ...) go through web3."""
+    selector, arg_types, via_web3, encode_word, address_indices, align = _compile_inputs(abi_key(fn_abi))
+    fn_abi_key = abi_key([fn_abi])
+    if via_web3:
+        return [encode_call(contract, fn_name, args, fn_abi_key=fn_abi_key) for args in params]
+    if not arg_types:
+        call_data = '0x' + selector.hex()
+        return [call_data if not args else encode_call(contract, fn_name, args, fn_abi_key=fn_abi_key)
+                for args in params]
+    encode = contract.w3.codec.encode
+    encoded = []
+    for args in params:
+        args = args or ()
+        if encode_word is not None and len(args) == 1:
+            word = encode_word(args[0])
+            if word is not None:
+                encoded.append('0x' + (selector + word).hex())
+                continue
+        try:
+            if len(args) != len(arg_types) or not all(is_checksum_address(args[i]) for i in address_indices):
+                raise ValueError
+            values = get_aligned_abi_inputs(fn_abi, args)[1] if align else args
+            encoded.append('0x' + (selector + encode(arg_types, values)).hex())
+        except (EncodingError, TypeError, ValueError):
+            encoded.append(encode_call(contract, fn_name, args, fn_abi_key=fn_abi_key))
+    return encoded